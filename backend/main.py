@@ -4,25 +4,32 @@ FastAPI application for managing Docker volume backups to QNAP NAS
 """
 
 import os
-import json
+import stat
+import time
 import asyncio
-import subprocess
 import logging
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Annotated, Optional, List, Dict, Any, Tuple
 from enum import Enum
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
+from functools import lru_cache, wraps
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, FileResponse, HTMLResponse
+from fastapi.responses import StreamingResponse, FileResponse, HTMLResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings
+import aiofiles
+import docker
+import orjson
+from docker.errors import DockerException
 
 from backend.scheduler import (
-    BackupScheduler, ScheduleConfig, ScheduleType, ScheduleStatus,
+    BackupScheduler, EnqueueResult, ScheduleConfig, ScheduleType, ScheduleStatus,
     SCHEDULE_PRESETS
 )
 
@@ -48,6 +55,14 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
+# Ejecutar en Docker si estamos en contenedor, o directamente si estamos en host
+_IS_CONTAINER = os.path.exists("/app/scripts")
+_SCRIPTS_ROOT = (
+    settings.SCRIPTS_DIR if _IS_CONTAINER
+    else os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "scripts"))
+)
+_BASE_ENV = {**os.environ, "QNAP_MOUNT_POINT": settings.QNAP_MOUNT_POINT}
+
 # Inicializar scheduler global
 backup_scheduler: Optional[BackupScheduler] = None
 
@@ -56,19 +71,24 @@ async def scheduled_backup_callback(backup_type: str, schedule_id: str):
     """Callback para ejecutar backups desde el scheduler"""
     task_id = f"scheduled_{backup_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
-    backup_tasks[task_id] = {
+    task = {
         "task_id": task_id,
         "backup_type": backup_type,
         "status": BackupStatus.PENDING,
         "started_at": datetime.now().isoformat(),
         "completed_at": None,
-        "output": [f"🕐 Backup programado iniciado (schedule: {schedule_id})"],
+        "output": deque([f"🕐 Backup programado iniciado (schedule: {schedule_id})"], maxlen=MAX_TASK_OUTPUT_LINES),
         "error": None,
         "scheduled": True,
         "schedule_id": schedule_id
     }
+    _put_task(task_id, task)
+    
+    await _guarded(run_backup_script, task_id, BackupType(backup_type))
     
-    await run_backup_script(task_id, BackupType(backup_type))
+    # run_backup_script no propaga errores: el scheduler necesita saber si falló
+    if task["status"] == BackupStatus.FAILED:
+        raise RuntimeError(task["error"] or "Backup fallido")
 
 
 @asynccontextmanager
@@ -101,6 +121,7 @@ app = FastAPI(
     version="2.0.0",
     docs_url="/api/docs",
     redoc_url="/api/redoc",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -113,8 +134,65 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Estado global de tareas
-backup_tasks: Dict[str, Dict[str, Any]] = {}
+# Estado global de tareas (acotado: se descartan las más antiguas)
+MAX_TASKS = 200
+MAX_TASK_OUTPUT_LINES = 2000
+backup_tasks: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+
+def _put_task(task_id: str, task: Dict[str, Any]):
+    """Registra una tarea, expulsando las más antiguas si se supera MAX_TASKS"""
+    backup_tasks[task_id] = task
+    backup_tasks.move_to_end(task_id)
+    while len(backup_tasks) > MAX_TASKS:
+        backup_tasks.popitem(last=False)
+
+
+def _task_to_dict(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Copia serializable de una tarea"""
+    return {**task, "output": list(task["output"])}
+
+
+# Trabajos largos (backup/restore): concurrencia acotada en este proceso.
+# Para más paralelismo o varios workers haría falta una cola externa (Celery/RQ).
+MAX_CONCURRENT_JOBS = 2
+_backup_sem = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
+_background_jobs: set = set()
+
+
+async def _bounded(sem: asyncio.Semaphore, fn, *args):
+    """Ejecuta fn(*args) dentro del semáforo"""
+    async with sem:
+        return await fn(*args)
+
+
+async def _guarded(fn, *args):
+    """Ejecuta un trabajo respetando el límite de concurrencia"""
+    return await _bounded(_backup_sem, fn, *args)
+
+
+def _spawn_job(fn, *args):
+    """Lanza un trabajo en segundo plano que sobrevive a la petición"""
+    job = asyncio.create_task(_guarded(fn, *args))
+    _background_jobs.add(job)
+    job.add_done_callback(_background_jobs.discard)
+
+
+# Suscriptores SSE por tarea (una cola por conexión)
+_task_listeners: Dict[str, List[asyncio.Queue]] = {}
+
+
+def _emit(task: Dict[str, Any], line: str):
+    """Añade una línea a la salida de la tarea y la publica a los suscriptores"""
+    task["output"].append(line)
+    for queue in _task_listeners.get(task["task_id"], ()):
+        queue.put_nowait({"line": line})
+
+
+def _close_listeners(task_id: str):
+    """Notifica el fin de la tarea a los suscriptores"""
+    for queue in _task_listeners.pop(task_id, ()):
+        queue.put_nowait(None)
 
 
 # ============================================
@@ -181,6 +259,7 @@ class RestoreRequest(BaseModel):
     """Solicitud de restauración"""
     timestamp: str
     components: List[str] = Field(default=["mongodb", "milvus", "postgres", "additional"])
+    sequential_execution: bool = False  # Restaurar volúmenes de uno en uno
 
 
 # ============================================
@@ -253,111 +332,298 @@ class ScheduleResponse(BaseModel):
     max_retries: int
 
 
+class ScheduleListItem(BaseModel):
+    """Resumen de schedule para el listado"""
+    id: str
+    name: str
+    description: str
+    status: str
+    schedule_type: str
+    backup_types: List[str]
+    cron_expression: Optional[str] = None
+    interval_minutes: Optional[int] = None
+    time_of_day: Optional[str] = None
+    days_of_week: Optional[List[int]] = None
+    next_run: Optional[str] = None
+    last_run: Optional[str] = None
+    last_status: Optional[str] = None
+    run_count: int
+
+
+VALID_BACKUP_TYPES = frozenset({'mongodb', 'milvus', 'postgres', 'additional', 'global'})
+
+# Campos obligatorios según el tipo de schedule
+_REQUIRED_FIELDS = {
+    'cron': ('cron_expression',),
+    'interval': ('interval_minutes',),
+    'daily': ('time_of_day',),
+    'weekly': ('time_of_day', 'days_of_week'),
+    'monthly': ('time_of_day', 'days_of_month'),
+    'once': ('run_date',),
+}
+
+
+# Los presets son estáticos: se serializan una sola vez
+_PRESETS_BODY = orjson.dumps({
+    'presets': [
+        {
+            'id': key,
+            **{k: v.value if hasattr(v, 'value') else v for k, v in preset.items()}
+        }
+        for key, preset in SCHEDULE_PRESETS.items()
+    ]
+})
+
+
 # ============================================
 # Utility Functions
 # ============================================
 
-def run_command(cmd: str, capture_output: bool = True) -> tuple[int, str, str]:
-    """Ejecuta un comando shell"""
+_ttl_store: Dict[Any, tuple] = {}
+
+
+def _ttl_cache(ttl: float):
+    """Memoiza el resultado de una función durante `ttl` segundos"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args):
+            key = (func.__name__, args)
+            cached = _ttl_store.get(key)
+            now = time.monotonic()
+            if cached and cached[1] > now:
+                return cached[0]
+            value = func(*args)
+            _ttl_store[key] = (value, now + ttl)
+            return value
+
+        def cache_clear():
+            for key in [k for k in _ttl_store if k[0] == func.__name__]:
+                _ttl_store.pop(key, None)
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
+
+
+async def run_command_async(cmd: str, timeout: float = 600) -> tuple[int, str, str]:
+    """Ejecuta un comando shell sin bloquear el event loop"""
     try:
-        result = subprocess.run(
+        process = await asyncio.create_subprocess_shell(
             cmd,
-            shell=True,
-            capture_output=capture_output,
-            text=True,
-            timeout=600
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
         )
-        return result.returncode, result.stdout, result.stderr
-    except subprocess.TimeoutExpired:
-        return -1, "", "Command timed out"
     except Exception as e:
         return -1, "", str(e)
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return -1, "", "Command timed out"
+    return process.returncode, stdout.decode(errors="replace"), stderr.decode(errors="replace")
+
+
+_docker_client: Optional[docker.DockerClient] = None
+
+
+def get_docker_client() -> Optional[docker.DockerClient]:
+    """Devuelve un cliente Docker reutilizable (socket UNIX), creado bajo demanda"""
+    global _docker_client
+    if _docker_client is None:
+        try:
+            _docker_client = docker.from_env()
+        except DockerException as e:
+            logger.debug(f"Docker no disponible: {e}")
+            return None
+    return _docker_client
 
 
+@_ttl_cache(ttl=3)
 def check_docker() -> bool:
     """Verifica si Docker está corriendo"""
-    code, _, _ = run_command("docker info > /dev/null 2>&1")
-    return code == 0
+    client = get_docker_client()
+    if client is None:
+        return False
+    try:
+        return client.ping()
+    except Exception:
+        return False
 
 
+@_ttl_cache(ttl=5)
 def check_qnap_mounted() -> bool:
     """Verifica si QNAP está montado"""
     return os.path.isdir(settings.QNAP_MOUNT_POINT) and os.access(settings.QNAP_MOUNT_POINT, os.W_OK)
 
 
+# Palabra clave en el nombre del volumen -> categoría (el orden importa)
+_VOLUME_CATEGORIES = (
+    ('mongo', 'mongodb'),
+    ('milvus', 'milvus'),
+    ('minio', 'milvus'),
+    ('etcd', 'milvus'),
+    ('postgres', 'postgres'),
+    ('redis', 'redis'),
+)
+
+
+@_ttl_cache(ttl=5)
 def get_docker_volumes() -> List[VolumeInfo]:
     """Obtiene lista de volúmenes Docker"""
-    code, stdout, _ = run_command("docker volume ls --format '{{.Name}}|{{.Driver}}'")
-    if code != 0:
+    client = get_docker_client()
+    if client is None:
+        return []
+    try:
+        raw_volumes = client.api.volumes().get("Volumes") or []
+    except Exception:
         return []
     
     volumes = []
-    for line in stdout.strip().split('\n'):
-        if not line:
-            continue
-        parts = line.split('|')
-        name = parts[0]
-        driver = parts[1] if len(parts) > 1 else "local"
+    for vol in raw_volumes:
+        name = vol["Name"]
+        driver = vol.get("Driver") or "local"
         
-        # Categorizar
-        if 'mongo' in name.lower():
-            category = 'mongodb'
-        elif 'milvus' in name.lower() or 'minio' in name.lower() or 'etcd' in name.lower():
-            category = 'milvus'
-        elif 'postgres' in name.lower():
-            category = 'postgres'
-        elif 'redis' in name.lower():
-            category = 'redis'
-        else:
-            category = 'other'
+        # Categorizar (primera palabra clave que coincida)
+        low = name.lower()
+        category = next((c for k, c in _VOLUME_CATEGORIES if k in low), 'other')
         
         volumes.append(VolumeInfo(name=name, driver=driver, category=category))
     
     return volumes
 
 
+@_ttl_cache(ttl=2)
 def get_running_containers() -> int:
     """Cuenta contenedores corriendo"""
-    code, stdout, _ = run_command("docker ps -q | wc -l")
-    if code != 0:
+    client = get_docker_client()
+    if client is None:
         return 0
-    return int(stdout.strip()) if stdout.strip() else 0
+    try:
+        return len(client.api.containers(quiet=True))
+    except Exception:
+        return 0
+
+
+# Instantánea (key, bad, data): key = mtime del directorio + mtimes de los JSON
+# ilegibles (ver _backups_key). Se sustituye entera para que ningún hilo vea una
+# clave nueva con datos viejos.
+_backups_cache: Tuple[Optional[tuple], List[str], List[BackupInfo]] = (None, [], [])
+
+# Lecturas concurrentes: el QNAP tiene mucha latencia por operación
+_io_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="backup-io")
+
+
+def _read_backup_json(path: str) -> Optional[BackupInfo]:
+    """Lee un backup_global_*.json; None si no es válido"""
+    try:
+        with open(path, "rb") as f:
+            data = orjson.loads(f.read())
+    except Exception:
+        return None
+    name = os.path.basename(path)
+    return BackupInfo(
+        timestamp=name[len("backup_global_"):-len(".json")],
+        backup_type="global",
+        path=path,
+        date=data.get("backup_date_local", ""),
+        components=data.get("components", {})
+    )
+
+
+def _backups_key(bad_paths: List[str]) -> Optional[tuple]:
+    """Clave de validez del listado: mtime del directorio y de los JSON ilegibles.
+    
+    Un JSON a medio escribir (backup_global.sh lo crea y luego lo rellena) no
+    cambia el mtime del directorio al completarse, pero sí el suyo propio.
+    """
+    try:
+        key = [os.stat(settings.BACKUP_BASE).st_mtime_ns]
+    except OSError:
+        return None
+    for path in bad_paths:
+        try:
+            key.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            key.append(-1)
+    return tuple(key)
 
 
 def get_backups_list() -> List[BackupInfo]:
     """Obtiene lista de backups disponibles"""
-    backups = []
-    backup_base = Path(settings.BACKUP_BASE)
+    return _get_backups()[1]
+
+
+def _get_backups() -> Tuple[Optional[tuple], List[BackupInfo]]:
+    """Listado de backups junto con la clave con la que se construyó"""
+    global _backups_cache
+    cached_key, cached_bad, cached_data = _backups_cache
+    key = _backups_key(cached_bad)
+    if key is None:
+        return None, []
     
-    if not backup_base.exists():
-        return backups
+    # Solo se re-escanea si cambia el directorio o algún JSON que no se pudo leer
+    if cached_key == key:
+        return cached_key, cached_data
     
     # Buscar archivos JSON de backup global
-    for json_file in backup_base.glob("backup_global_*.json"):
-        try:
-            with open(json_file) as f:
-                data = json.load(f)
-            
-            timestamp = json_file.stem.replace("backup_global_", "")
-            backups.append(BackupInfo(
-                timestamp=timestamp,
-                backup_type="global",
-                path=str(json_file),
-                date=data.get("backup_date_local", ""),
-                components=data.get("components", {})
-            ))
-        except Exception:
-            continue
+    # (los mtimes se toman antes de leer: si algo cambia durante la lectura, se re-escanea)
+    with os.scandir(settings.BACKUP_BASE) as it:
+        entries = [
+            (entry.path, entry.stat().st_mtime_ns) for entry in it
+            if entry.name.startswith("backup_global_") and entry.name.endswith(".json")
+        ]
+    
+    results = list(_io_pool.map(_read_backup_json, [path for path, _ in entries]))
+    backups = [b for b in results if b is not None]
+    bad = [(path, mtime) for (path, mtime), b in zip(entries, results) if b is None]
     
     # Ordenar por timestamp descendente
     backups.sort(key=lambda x: x.timestamp, reverse=True)
-    return backups
+    new_key = key[:1] + tuple(mtime for _, mtime in bad)
+    _backups_cache = (new_key, [path for path, _ in bad], backups)
+    return new_key, backups
+
+
+def _human_size(n: float) -> str:
+    """Formatea bytes en unidades legibles (estilo du -h)"""
+    for unit in ("B", "K", "M", "G", "T"):
+        if n < 1024 or unit == "T":
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+
+
+@lru_cache(maxsize=512)
+def _dir_size(path: str, mtime_ns: int) -> int:
+    """Suma recursiva de tamaños; mtime_ns solo forma parte de la clave de caché"""
+    total = 0
+    stack = [path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        else:
+                            total += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return total
 
 
 def get_backup_size(path: str) -> str:
     """Obtiene tamaño de un directorio"""
-    code, stdout, _ = run_command(f"du -sh '{path}' 2>/dev/null | cut -f1")
-    return stdout.strip() if code == 0 else "N/A"
+    try:
+        info = os.stat(path)
+    except OSError:
+        return "N/A"
+    if not stat.S_ISDIR(info.st_mode):
+        return _human_size(info.st_size)
+    return _human_size(_dir_size(path, info.st_mtime_ns))
 
 
 # ============================================
@@ -377,31 +643,32 @@ async def run_backup_script(task_id: str, backup_type: BackupType):
     }
     
     script_name = script_map.get(backup_type, "backup_global.sh")
-    script_path = f"{settings.SCRIPTS_DIR}/{script_name}"
-    
-    # Ejecutar en Docker si estamos en contenedor, o directamente si estamos en host
-    if os.path.exists("/app/scripts"):
-        cmd = f"QNAP_MOUNT_POINT={settings.QNAP_MOUNT_POINT} bash {script_path}"
-    else:
-        # Estamos en el host
-        script_path = os.path.join(os.path.dirname(__file__), "..", "scripts", script_name)
-        cmd = f"QNAP_MOUNT_POINT={settings.QNAP_MOUNT_POINT} bash {script_path}"
+    script_path = f"{_SCRIPTS_ROOT}/{script_name}"
     
     try:
-        process = await asyncio.create_subprocess_shell(
-            cmd,
+        process = await asyncio.create_subprocess_exec(
+            "bash", script_path,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.STDOUT,
-            env={**os.environ, "QNAP_MOUNT_POINT": settings.QNAP_MOUNT_POINT}
+            env=_BASE_ENV
         )
         
+        # Leer en bloques y partir en líneas localmente (menos despertares del loop)
+        buf = b""
         while True:
-            line = await process.stdout.readline()
-            if not line:
+            chunk = await process.stdout.read(65536)
+            if not chunk:
                 break
-            decoded = line.decode().strip()
-            if decoded:
-                task["output"].append(decoded)
+            buf += chunk
+            *lines, buf = buf.split(b"\n")
+            for line in lines:
+                decoded = line.decode(errors="replace").strip()
+                if decoded:
+                    _emit(task, decoded)
+        
+        decoded = buf.decode(errors="replace").strip()
+        if decoded:
+            _emit(task, decoded)
         
         await process.wait()
         
@@ -416,18 +683,54 @@ async def run_backup_script(task_id: str, backup_type: BackupType):
         task["error"] = str(e)
     
     task["completed_at"] = datetime.now().isoformat()
+    _close_listeners(task_id)
+
+
+RESTORE_CONCURRENCY = 4
+
+
+async def _restore_volume(task: Dict[str, Any], actual_path: str, tar_file: Path):
+    """Restaura un volumen Docker desde su tar.gz"""
+    vol_name = tar_file.stem.replace(".tar", "")
+    
+    # Crear volumen
+    process = await asyncio.create_subprocess_exec(
+        "docker", "volume", "create", vol_name,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    await process.wait()
+    
+    # Restaurar usando actual_path que puede ser el subdirectorio volumes/
+    process = await asyncio.create_subprocess_exec(
+        "docker", "run", "--rm",
+        "-v", f"{vol_name}:/target",
+        "-v", f"{actual_path}:/backup:ro",
+        "alpine:latest",
+        "tar", "-xzf", f"/backup/{tar_file.name}", "-C", "/target",
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    await process.wait()
+    
+    if process.returncode == 0:
+        _emit(task, f"   ✅ {vol_name}")
+    else:
+        _emit(task, f"   ❌ {vol_name}")
 
 
-async def run_restore_script(task_id: str, timestamp: str, components: List[str]):
+async def run_restore_script(task_id: str, timestamp: str, components: List[str],
+                             sequential_execution: bool = False):
     """Ejecuta restauración en background"""
     task = backup_tasks[task_id]
     task["status"] = BackupStatus.RUNNING
     
     backup_base = settings.BACKUP_BASE
+    restore_sem = asyncio.Semaphore(1 if sequential_execution else RESTORE_CONCURRENCY)
     
     try:
         for component in components:
-            task["output"].append(f"🔄 Restaurando {component}...")
+            _emit(task, f"🔄 Restaurando {component}...")
             
             if component == "mongodb":
                 backup_path = f"{backup_base}/mongodb/mongodb_backup_{timestamp}"
@@ -441,7 +744,7 @@ async def run_restore_script(task_id: str, timestamp: str, components: List[str]
                 continue
             
             if not os.path.isdir(backup_path):
-                task["output"].append(f"⚠️ No se encontró backup de {component} para {timestamp}")
+                _emit(task, f"⚠️ No se encontró backup de {component} para {timestamp}")
                 continue
             
             # Detectar subdirectorio volumes/ (nuevo formato de backup)
@@ -449,34 +752,16 @@ async def run_restore_script(task_id: str, timestamp: str, components: List[str]
             volumes_subdir = Path(backup_path) / "volumes"
             if volumes_subdir.is_dir():
                 actual_path = str(volumes_subdir)
-                task["output"].append(f"   📁 Usando subdirectorio volumes/")
+                _emit(task, f"   📁 Usando subdirectorio volumes/")
             
-            # Restaurar cada volumen
-            for tar_file in Path(actual_path).glob("*.tar.gz"):
-                vol_name = tar_file.stem.replace(".tar", "")
-                
-                # Crear volumen
-                await asyncio.create_subprocess_shell(
-                    f"docker volume create {vol_name}",
-                    stdout=asyncio.subprocess.DEVNULL,
-                    stderr=asyncio.subprocess.DEVNULL
-                )
-                
-                # Restaurar usando actual_path que puede ser el subdirectorio volumes/
-                cmd = f"docker run --rm -v {vol_name}:/target -v {actual_path}:/backup:ro alpine:latest sh -c 'tar -xzf /backup/{tar_file.name} -C /target'"
-                process = await asyncio.create_subprocess_shell(
-                    cmd,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
-                )
-                await process.wait()
-                
-                if process.returncode == 0:
-                    task["output"].append(f"   ✅ {vol_name}")
-                else:
-                    task["output"].append(f"   ❌ {vol_name}")
+            # Restaurar volúmenes en paralelo (cada uno en su propio contenedor)
+            tars = list(Path(actual_path).glob("*.tar.gz"))
+            await asyncio.gather(*(
+                _bounded(restore_sem, _restore_volume, task, actual_path, tar_file)
+                for tar_file in tars
+            ))
             
-            task["output"].append(f"✅ {component} restaurado")
+            _emit(task, f"✅ {component} restaurado")
         
         task["status"] = BackupStatus.COMPLETED
         
@@ -485,6 +770,7 @@ async def run_restore_script(task_id: str, timestamp: str, components: List[str]
         task["error"] = str(e)
     
     task["completed_at"] = datetime.now().isoformat()
+    _close_listeners(task_id)
 
 
 # ============================================
@@ -500,11 +786,15 @@ async def health_check():
 @app.get("/api/status", response_model=SystemStatus)
 async def get_system_status():
     """Obtiene estado del sistema"""
-    docker_running = check_docker()
-    qnap_mounted = check_qnap_mounted()
-    volumes = get_docker_volumes() if docker_running else []
-    containers = get_running_containers() if docker_running else 0
-    backups = get_backups_list() if qnap_mounted else []
+    docker_running, qnap_mounted = await asyncio.gather(
+        asyncio.to_thread(check_docker),
+        asyncio.to_thread(check_qnap_mounted)
+    )
+    volumes, containers, backups = await asyncio.gather(
+        asyncio.to_thread(get_docker_volumes) if docker_running else asyncio.sleep(0, []),
+        asyncio.to_thread(get_running_containers) if docker_running else asyncio.sleep(0, 0),
+        asyncio.to_thread(get_backups_list) if qnap_mounted else asyncio.sleep(0, [])
+    )
     
     return SystemStatus(
         docker_running=docker_running,
@@ -521,86 +811,117 @@ async def get_system_status():
 @app.get("/api/volumes", response_model=List[VolumeInfo])
 async def list_volumes():
     """Lista volúmenes Docker"""
-    if not check_docker():
+    if not await asyncio.to_thread(check_docker):
         raise HTTPException(status_code=503, detail="Docker no está corriendo")
-    return get_docker_volumes()
+    return await asyncio.to_thread(get_docker_volumes)
+
+
+def _backups_etag(*paths: str) -> Optional[str]:
+    """ETag derivado del mtime de BACKUP_BASE (y de los ficheros indicados)"""
+    try:
+        mtimes = [os.stat(p).st_mtime_ns for p in (settings.BACKUP_BASE, *paths)]
+    except OSError:
+        return None
+    return '"' + "-".join(format(m, "x") for m in mtimes) + '"'
+
+
+def _not_modified(request: Request, response: Response, etag: Optional[str],
+                  cache_control: str = "private, max-age=5") -> bool:
+    """Añade cabeceras de caché; True si el cliente ya tiene la versión actual"""
+    if etag is None:
+        return False
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    return request.headers.get("if-none-match") == etag
 
 
 @app.get("/api/backups", response_model=List[BackupInfo])
-async def list_backups():
+async def list_backups(request: Request, response: Response):
     """Lista backups disponibles"""
-    if not check_qnap_mounted():
+    if not await asyncio.to_thread(check_qnap_mounted):
         raise HTTPException(status_code=503, detail="QNAP no está montado")
-    return get_backups_list()
+    
+    # El ETag sale de la clave de este mismo listado (no de la caché global,
+    # que otro hilo puede haber renovado entretanto)
+    key, backups = await asyncio.to_thread(_get_backups)
+    etag = '"' + "-".join(format(m, "x") for m in key) + '"' if key else None
+    if _not_modified(request, response, etag):
+        return Response(status_code=304, headers=dict(response.headers))
+    return backups
 
 
 @app.get("/api/backups/{timestamp}")
-async def get_backup_detail(timestamp: str):
+async def get_backup_detail(timestamp: str, request: Request, response: Response):
     """Obtiene detalle de un backup específico"""
     json_path = Path(settings.BACKUP_BASE) / f"backup_global_{timestamp}.json"
     
     if not json_path.exists():
         raise HTTPException(status_code=404, detail="Backup no encontrado")
     
-    with open(json_path) as f:
-        data = json.load(f)
+    etag = await asyncio.to_thread(_backups_etag, str(json_path))
+    if _not_modified(request, response, etag):
+        return Response(status_code=304, headers=dict(response.headers))
+    
+    with open(json_path, "rb") as f:
+        data = orjson.loads(f.read())
     
     # Agregar tamaños actuales
     for key, comp in data.get("components", {}).items():
         if "path" in comp:
             full_path = Path(settings.BACKUP_BASE) / comp["path"]
             if full_path.exists():
-                comp["current_size"] = get_backup_size(str(full_path))
+                comp["current_size"] = await asyncio.to_thread(get_backup_size, str(full_path))
     
     return data
 
 
 @app.post("/api/backup/{backup_type}")
-async def start_backup(backup_type: BackupType, background_tasks: BackgroundTasks):
+async def start_backup(backup_type: BackupType):
     """Inicia un backup"""
-    if not check_docker():
+    if not await asyncio.to_thread(check_docker):
         raise HTTPException(status_code=503, detail="Docker no está corriendo")
-    if not check_qnap_mounted():
+    if not await asyncio.to_thread(check_qnap_mounted):
         raise HTTPException(status_code=503, detail="QNAP no está montado")
     
     task_id = f"backup_{backup_type.value}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
-    backup_tasks[task_id] = {
+    _put_task(task_id, {
         "task_id": task_id,
         "backup_type": backup_type,
         "status": BackupStatus.PENDING,
         "started_at": datetime.now().isoformat(),
         "completed_at": None,
-        "output": [],
+        "output": deque(maxlen=MAX_TASK_OUTPUT_LINES),
         "error": None
-    }
+    })
     
-    background_tasks.add_task(run_backup_script, task_id, backup_type)
+    _spawn_job(run_backup_script, task_id, backup_type)
     
     return {"task_id": task_id, "message": f"Backup {backup_type.value} iniciado"}
 
 
 @app.post("/api/restore")
-async def start_restore(request: RestoreRequest, background_tasks: BackgroundTasks):
+async def start_restore(request: RestoreRequest):
     """Inicia una restauración"""
-    if not check_docker():
+    if not await asyncio.to_thread(check_docker):
         raise HTTPException(status_code=503, detail="Docker no está corriendo")
-    if not check_qnap_mounted():
+    if not await asyncio.to_thread(check_qnap_mounted):
         raise HTTPException(status_code=503, detail="QNAP no está montado")
     
     task_id = f"restore_{request.timestamp}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
-    backup_tasks[task_id] = {
+    _put_task(task_id, {
         "task_id": task_id,
         "backup_type": "restore",
         "status": BackupStatus.PENDING,
         "started_at": datetime.now().isoformat(),
         "completed_at": None,
-        "output": [],
+        "output": deque(maxlen=MAX_TASK_OUTPUT_LINES),
         "error": None
-    }
+    })
     
-    background_tasks.add_task(run_restore_script, task_id, request.timestamp, request.components)
+    _spawn_job(run_restore_script, task_id, request.timestamp, request.components,
+               request.sequential_execution)
     
     return {"task_id": task_id, "message": f"Restauración iniciada para {request.timestamp}"}
 
@@ -610,28 +931,63 @@ async def get_task_status(task_id: str):
     """Obtiene estado de una tarea"""
     if task_id not in backup_tasks:
         raise HTTPException(status_code=404, detail="Tarea no encontrada")
-    return backup_tasks[task_id]
+    return _task_to_dict(backup_tasks[task_id])
+
+
+@app.get("/api/tasks/{task_id}/stream")
+async def stream_task_output(task_id: str):
+    """Emite la salida de una tarea en tiempo real (Server-Sent Events)"""
+    if task_id not in backup_tasks:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    
+    task = backup_tasks[task_id]
+    finished = task["status"] in (BackupStatus.COMPLETED, BackupStatus.FAILED)
+    queue: asyncio.Queue = asyncio.Queue()
+    if not finished:
+        _task_listeners.setdefault(task_id, []).append(queue)
+    backlog = list(task["output"])
+    
+    async def event_gen():
+        try:
+            for line in backlog:
+                yield f"data: {orjson.dumps({'line': line}).decode()}\n\n"
+            if not finished:
+                while (item := await queue.get()) is not None:
+                    yield f"data: {orjson.dumps(item).decode()}\n\n"
+            end = {"status": task["status"], "error": task["error"]}
+            yield f"event: end\ndata: {orjson.dumps(end).decode()}\n\n"
+        finally:
+            listeners = _task_listeners.get(task_id)
+            if listeners and queue in listeners:
+                listeners.remove(queue)
+    
+    return StreamingResponse(
+        event_gen(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
 
 
 @app.get("/api/tasks")
 async def list_tasks():
     """Lista todas las tareas"""
-    return list(backup_tasks.values())
+    return [_task_to_dict(t) for t in backup_tasks.values()]
 
 
 @app.post("/api/mount-qnap")
 async def mount_qnap():
     """Intenta montar el QNAP"""
-    if check_qnap_mounted():
+    if await asyncio.to_thread(check_qnap_mounted):
         return {"status": "already_mounted", "path": settings.QNAP_MOUNT_POINT}
     
     # Intentar abrir en Finder (macOS)
-    code, _, _ = run_command(f"open 'smb://{settings.QNAP_HOST}/{settings.QNAP_SHARE}'")
+    code, _, _ = await run_command_async(f"open 'smb://{settings.QNAP_HOST}/{settings.QNAP_SHARE}'")
     
     # Esperar un poco
     await asyncio.sleep(3)
     
-    if check_qnap_mounted():
+    check_qnap_mounted.cache_clear()
+    if await asyncio.to_thread(check_qnap_mounted):
         return {"status": "mounted", "path": settings.QNAP_MOUNT_POINT}
     
     raise HTTPException(
@@ -650,41 +1006,52 @@ async def get_backup_logs(timestamp: str):
     ]
     
     logs_dir = Path(settings.BACKUP_BASE) / "logs"
-    logs_content = {}
-    
-    for pattern in log_patterns:
-        log_file = logs_dir / pattern
-        if log_file.exists():
-            with open(log_file) as f:
-                logs_content[pattern] = f.read()
+    existing = await asyncio.to_thread(
+        lambda: [(p, logs_dir / p) for p in log_patterns if (logs_dir / p).is_file()]
+    )
     
-    if not logs_content:
+    if not existing:
         raise HTTPException(status_code=404, detail="No se encontraron logs")
     
-    return logs_content
+    async def gen():
+        for pattern, log_file in existing:
+            yield f"===== {pattern} =====\n".encode()
+            try:
+                async with aiofiles.open(log_file, "rb") as f:
+                    while chunk := await f.read(65536):
+                        yield chunk
+            except FileNotFoundError:
+                continue
+            yield b"\n"
+    
+    return StreamingResponse(gen(), media_type="text/plain")
 
 
 @app.get("/api/disk-usage")
 async def get_disk_usage():
     """Obtiene uso de disco del QNAP"""
-    if not check_qnap_mounted():
+    if not await asyncio.to_thread(check_qnap_mounted):
         raise HTTPException(status_code=503, detail="QNAP no está montado")
     
-    code, stdout, _ = run_command(f"df -h '{settings.QNAP_MOUNT_POINT}' | tail -1")
-    if code != 0:
+    try:
+        st = await asyncio.to_thread(os.statvfs, settings.QNAP_MOUNT_POINT)
+    except OSError:
         raise HTTPException(status_code=500, detail="Error obteniendo uso de disco")
     
-    parts = stdout.split()
-    if len(parts) >= 5:
-        return {
-            "total": parts[1],
-            "used": parts[2],
-            "available": parts[3],
-            "percent_used": parts[4],
-            "mount_point": settings.QNAP_MOUNT_POINT
-        }
+    total = st.f_blocks * st.f_frsize
+    available = st.f_bavail * st.f_frsize
+    used = total - st.f_bfree * st.f_frsize
+    # Igual que df: porcentaje sobre el espacio accesible (usado + disponible)
+    usable = used + available
+    percent = -(-used * 100 // usable) if usable else 0
     
-    return {"raw": stdout}
+    return {
+        "total": _human_size(total),
+        "used": _human_size(used),
+        "available": _human_size(available),
+        "percent_used": f"{percent}%",
+        "mount_point": settings.QNAP_MOUNT_POINT
+    }
 
 
 # ============================================
@@ -718,116 +1085,115 @@ def schedule_to_response(schedule: ScheduleConfig) -> ScheduleResponse:
     )
 
 
-@app.get("/api/schedules", response_model=List[ScheduleResponse])
-async def list_schedules():
-    """Lista todos los schedules de backup"""
-    if not backup_scheduler:
+def schedule_to_list_item(schedule: ScheduleConfig) -> ScheduleListItem:
+    """Convierte ScheduleConfig a ScheduleListItem"""
+    return ScheduleListItem(
+        id=schedule.id,
+        name=schedule.name,
+        description=schedule.description,
+        status=schedule.status.value,
+        schedule_type=schedule.schedule_type.value,
+        backup_types=schedule.backup_types,
+        cron_expression=schedule.cron_expression,
+        interval_minutes=schedule.interval_minutes,
+        time_of_day=schedule.time_of_day,
+        days_of_week=schedule.days_of_week,
+        next_run=schedule.next_run,
+        last_run=schedule.last_run,
+        last_status=schedule.last_status,
+        run_count=schedule.run_count
+    )
+
+
+def get_scheduler() -> BackupScheduler:
+    """Dependencia: scheduler inicializado o 503"""
+    if backup_scheduler is None:
         raise HTTPException(status_code=503, detail="Scheduler no inicializado")
-    
-    schedules = backup_scheduler.get_all_schedules()
-    return [schedule_to_response(s) for s in schedules]
+    return backup_scheduler
+
+
+SchedulerDep = Annotated[BackupScheduler, Depends(get_scheduler)]
+
+
+@app.get("/api/schedules", response_model=List[ScheduleListItem])
+async def list_schedules(scheduler: SchedulerDep, request: Request, response: Response):
+    """Lista todos los schedules de backup (resumen; detalle en /api/schedules/{id})"""
+    if _not_modified(request, response, scheduler.etag, "private, no-cache"):
+        return Response(status_code=304, headers=dict(response.headers))
+    return scheduler.get_all_responses(schedule_to_list_item)
 
 
 @app.get("/api/schedules/stats")
-async def get_scheduler_stats():
+async def get_scheduler_stats(scheduler: SchedulerDep, request: Request, response: Response):
     """Obtiene estadísticas del scheduler"""
-    if not backup_scheduler:
-        raise HTTPException(status_code=503, detail="Scheduler no inicializado")
-    
-    return backup_scheduler.get_stats()
+    if _not_modified(request, response, scheduler.etag, "private, no-cache"):
+        return Response(status_code=304, headers=dict(response.headers))
+    return ORJSONResponse(scheduler.get_stats(), headers=dict(response.headers))
 
 
 @app.get("/api/schedules/presets")
 async def get_schedule_presets():
     """Obtiene presets de schedules predefinidos"""
-    return {
-        'presets': [
-            {
-                'id': key,
-                **{k: v.value if hasattr(v, 'value') else v for k, v in preset.items()}
-            }
-            for key, preset in SCHEDULE_PRESETS.items()
-        ]
-    }
+    return Response(content=_PRESETS_BODY, media_type="application/json")
 
 
 @app.get("/api/schedules/history")
-async def get_schedule_history(schedule_id: Optional[str] = None, limit: int = 20):
+async def get_schedule_history(scheduler: SchedulerDep, schedule_id: Optional[str] = None, limit: int = 20):
     """Obtiene historial de ejecuciones de schedules"""
-    if not backup_scheduler:
-        raise HTTPException(status_code=503, detail="Scheduler no inicializado")
-    
-    return {"history": backup_scheduler.get_history(schedule_id, limit)}
+    return ORJSONResponse({"history": scheduler.get_history(schedule_id, limit)})
 
 
 @app.post("/api/schedules", response_model=ScheduleResponse)
-async def create_schedule(request: ScheduleCreateRequest):
+async def create_schedule(scheduler: SchedulerDep, request: ScheduleCreateRequest):
     """Crea un nuevo schedule de backup"""
-    if not backup_scheduler:
-        raise HTTPException(status_code=503, detail="Scheduler no inicializado")
-    
     # Validar backup_types
-    valid_types = {'mongodb', 'milvus', 'postgres', 'additional', 'global'}
-    for bt in request.backup_types:
-        if bt not in valid_types:
-            raise HTTPException(status_code=400, detail=f"Tipo de backup inválido: {bt}")
+    if not VALID_BACKUP_TYPES.issuperset(request.backup_types):
+        invalid = next(bt for bt in request.backup_types if bt not in VALID_BACKUP_TYPES)
+        raise HTTPException(status_code=400, detail=f"Tipo de backup inválido: {invalid}")
     
     # Validar configuración según tipo
-    if request.schedule_type == 'cron' and not request.cron_expression:
-        raise HTTPException(status_code=400, detail="Se requiere cron_expression para tipo cron")
-    if request.schedule_type == 'interval' and not request.interval_minutes:
-        raise HTTPException(status_code=400, detail="Se requiere interval_minutes para tipo interval")
-    if request.schedule_type in ['daily', 'weekly', 'monthly'] and not request.time_of_day:
-        raise HTTPException(status_code=400, detail=f"Se requiere time_of_day para tipo {request.schedule_type}")
-    if request.schedule_type == 'weekly' and not request.days_of_week:
-        raise HTTPException(status_code=400, detail="Se requiere days_of_week para tipo weekly")
-    if request.schedule_type == 'monthly' and not request.days_of_month:
-        raise HTTPException(status_code=400, detail="Se requiere days_of_month para tipo monthly")
-    if request.schedule_type == 'once' and not request.run_date:
-        raise HTTPException(status_code=400, detail="Se requiere run_date para tipo once")
+    for field_name in _REQUIRED_FIELDS.get(request.schedule_type, ()):
+        if not getattr(request, field_name):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Se requiere {field_name} para tipo {request.schedule_type}"
+            )
     
     try:
-        schedule = backup_scheduler.create_schedule(request.model_dump())
+        schedule = scheduler.create_schedule(request.model_dump())
         return schedule_to_response(schedule)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/api/schedules/from-preset/{preset_id}", response_model=ScheduleResponse)
-async def create_from_preset(preset_id: str):
+async def create_from_preset(scheduler: SchedulerDep, preset_id: str):
     """Crea un schedule desde un preset predefinido"""
-    if not backup_scheduler:
-        raise HTTPException(status_code=503, detail="Scheduler no inicializado")
-    
-    if preset_id not in SCHEDULE_PRESETS:
+    schedule = scheduler.create_from_preset(preset_id)
+    if not schedule:
         raise HTTPException(status_code=404, detail=f"Preset no encontrado: {preset_id}")
     
-    preset = SCHEDULE_PRESETS[preset_id].copy()
-    schedule = backup_scheduler.create_schedule(preset)
     return schedule_to_response(schedule)
 
 
 @app.get("/api/schedules/{schedule_id}", response_model=ScheduleResponse)
-async def get_schedule(schedule_id: str):
+async def get_schedule(scheduler: SchedulerDep, schedule_id: str):
     """Obtiene un schedule por ID"""
-    if not backup_scheduler:
-        raise HTTPException(status_code=503, detail="Scheduler no inicializado")
-    
-    schedule = backup_scheduler.get_schedule(schedule_id)
-    if not schedule:
+    response = scheduler.get_response(schedule_id, schedule_to_response)
+    if not response:
         raise HTTPException(status_code=404, detail="Schedule no encontrado")
     
-    return schedule_to_response(schedule)
+    return response
 
 
 @app.put("/api/schedules/{schedule_id}", response_model=ScheduleResponse)
-async def update_schedule(schedule_id: str, request: ScheduleUpdateRequest):
+async def update_schedule(scheduler: SchedulerDep, schedule_id: str, request: ScheduleUpdateRequest):
     """Actualiza un schedule existente"""
-    if not backup_scheduler:
-        raise HTTPException(status_code=503, detail="Scheduler no inicializado")
-    
     updates = {k: v for k, v in request.model_dump().items() if v is not None}
-    schedule = backup_scheduler.update_schedule(schedule_id, updates)
+    try:
+        schedule = scheduler.update_schedule(schedule_id, updates)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     if not schedule:
         raise HTTPException(status_code=404, detail="Schedule no encontrado")
@@ -836,24 +1202,18 @@ async def update_schedule(schedule_id: str, request: ScheduleUpdateRequest):
 
 
 @app.delete("/api/schedules/{schedule_id}")
-async def delete_schedule(schedule_id: str):
+async def delete_schedule(scheduler: SchedulerDep, schedule_id: str):
     """Elimina un schedule"""
-    if not backup_scheduler:
-        raise HTTPException(status_code=503, detail="Scheduler no inicializado")
-    
-    if not backup_scheduler.delete_schedule(schedule_id):
+    if not scheduler.delete_schedule(schedule_id):
         raise HTTPException(status_code=404, detail="Schedule no encontrado")
     
     return {"status": "deleted", "schedule_id": schedule_id}
 
 
 @app.post("/api/schedules/{schedule_id}/pause")
-async def pause_schedule(schedule_id: str):
+async def pause_schedule(scheduler: SchedulerDep, schedule_id: str):
     """Pausa un schedule"""
-    if not backup_scheduler:
-        raise HTTPException(status_code=503, detail="Scheduler no inicializado")
-    
-    schedule = backup_scheduler.pause_schedule(schedule_id)
+    schedule = scheduler.pause_schedule(schedule_id)
     if not schedule:
         raise HTTPException(status_code=404, detail="Schedule no encontrado")
     
@@ -861,12 +1221,9 @@ async def pause_schedule(schedule_id: str):
 
 
 @app.post("/api/schedules/{schedule_id}/resume")
-async def resume_schedule(schedule_id: str):
+async def resume_schedule(scheduler: SchedulerDep, schedule_id: str):
     """Reanuda un schedule pausado"""
-    if not backup_scheduler:
-        raise HTTPException(status_code=503, detail="Scheduler no inicializado")
-    
-    schedule = backup_scheduler.resume_schedule(schedule_id)
+    schedule = scheduler.resume_schedule(schedule_id)
     if not schedule:
         raise HTTPException(status_code=404, detail="Schedule no encontrado")
     
@@ -874,17 +1231,19 @@ async def resume_schedule(schedule_id: str):
 
 
 @app.post("/api/schedules/{schedule_id}/run-now")
-async def run_schedule_now(schedule_id: str):
+async def run_schedule_now(scheduler: SchedulerDep, schedule_id: str):
     """Ejecuta un schedule inmediatamente"""
-    if not backup_scheduler:
-        raise HTTPException(status_code=503, detail="Scheduler no inicializado")
-    
-    if not check_qnap_mounted():
+    if not await asyncio.to_thread(check_qnap_mounted):
         raise HTTPException(status_code=503, detail="QNAP no está montado")
     
-    if not backup_scheduler.run_now(schedule_id):
+    result = scheduler.run_now(schedule_id)
+    if result == EnqueueResult.NOT_FOUND:
         raise HTTPException(status_code=404, detail="Schedule no encontrado")
+    if result == EnqueueResult.FULL:
+        raise HTTPException(status_code=503, detail="Cola de backups llena, ejecución descartada")
     
+    if result == EnqueueResult.QUEUED:
+        return {"status": "queued", "schedule_id": schedule_id, "message": "Backup en cola"}
     return {"status": "started", "schedule_id": schedule_id, "message": "Backup iniciado"}
 
 
@@ -914,4 +1273,4 @@ if static_dir.exists():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=6640)
+    uvicorn.run(app, host="0.0.0.0", port=6640, loop="uvloop", http="httptools")
@@ -4,25 +4,38 @@ Sistema de programación de backups con APScheduler
 """
 
 import os
-import json
 import asyncio
 import logging
+import heapq
+import itertools
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, List, Dict, Any, Callable
+from typing import Optional, List, Dict, Any, Callable, Tuple
 from enum import Enum
-from dataclasses import dataclass, asdict, field
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass, field, fields, replace
+from functools import lru_cache
 from uuid import uuid4
 
+import orjson
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.date import DateTrigger
 from apscheduler.jobstores.memory import MemoryJobStore
-from croniter import croniter
+try:
+    from croniter_rs import croniter  # Implementación en Rust, misma API
+except ImportError:
+    from croniter import croniter
 
 logger = logging.getLogger(__name__)
 
+# Segundos que se agrupan las escrituras de schedules.json
+SAVE_DEBOUNCE_SECONDS = 2.0
+
+# Ejecuciones programadas que pueden esperar turno mientras corre otro backup
+BACKUP_QUEUE_SIZE = 32
+
 
 class ScheduleType(str, Enum):
     """Tipos de programación"""
@@ -34,6 +47,14 @@ class ScheduleType(str, Enum):
     ONCE = "once"           # Una sola vez
 
 
+class EnqueueResult(str, Enum):
+    """Resultado de encolar una ejecución"""
+    STARTED = "started"      # Cola vacía y sin backup en curso: arranca ya
+    QUEUED = "queued"        # Espera detrás de otro backup (o ya estaba en cola)
+    FULL = "full"            # Cola llena: ejecución descartada
+    NOT_FOUND = "not_found"
+
+
 class ScheduleStatus(str, Enum):
     """Estados de schedule"""
     ACTIVE = "active"
@@ -41,7 +62,7 @@ class ScheduleStatus(str, Enum):
     DISABLED = "disabled"
 
 
-@dataclass
+@dataclass(slots=True)
 class ScheduleConfig:
     """Configuración de un schedule de backup"""
     id: str
@@ -73,19 +94,117 @@ class ScheduleConfig:
     notification_email: Optional[str] = None
     sequential_execution: bool = True  # Ejecutar tipos de backup secuencialmente
     
+    # Derivados (no se serializan): evitan re-parsear en cada cálculo de trigger
+    _hm: Optional[Tuple[int, int]] = field(default=None, init=False, repr=False, compare=False)
+    _dow_str: str = field(default='', init=False, repr=False, compare=False)
+    _dom_str: str = field(default='', init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        self.refresh_derived()
+    
+    def refresh_derived(self):
+        """Recalcula hora/minuto y listas de días precomputadas"""
+        try:
+            hour, minute = map(int, self.time_of_day.split(':'))
+            self._hm = (hour, minute)
+        except (AttributeError, ValueError):
+            self._hm = None
+        self._dow_str = ','.join(map(str, self.days_of_week or ()))
+        self._dom_str = ','.join(map(str, self.days_of_month or ()))
+    
     def to_dict(self) -> Dict[str, Any]:
-        """Convierte a diccionario"""
-        return asdict(self)
+        """Convierte a diccionario (sin el deepcopy de asdict)"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'backup_types': list(self.backup_types),
+            'schedule_type': self.schedule_type.value,
+            'status': self.status.value,
+            'cron_expression': self.cron_expression,
+            'interval_minutes': self.interval_minutes,
+            'time_of_day': self.time_of_day,
+            'days_of_week': list(self.days_of_week) if self.days_of_week is not None else None,
+            'days_of_month': list(self.days_of_month) if self.days_of_month is not None else None,
+            'run_date': self.run_date,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'last_run': self.last_run,
+            'next_run': self.next_run,
+            'run_count': self.run_count,
+            'last_status': self.last_status,
+            'retry_on_failure': self.retry_on_failure,
+            'max_retries': self.max_retries,
+            'notification_email': self.notification_email,
+            'sequential_execution': self.sequential_execution,
+        }
     
     @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> 'ScheduleConfig':
-        """Crea desde diccionario"""
+    def from_dict(cls, data: Dict[str, Any], now_iso: Optional[str] = None) -> 'ScheduleConfig':
+        """Crea desde diccionario (ignora claves desconocidas)"""
+        kwargs = {k: v for k, v in data.items() if k in _FIELDS}
         # Convertir enums
-        if isinstance(data.get('schedule_type'), str):
-            data['schedule_type'] = ScheduleType(data['schedule_type'])
-        if isinstance(data.get('status'), str):
-            data['status'] = ScheduleStatus(data['status'])
-        return cls(**data)
+        if isinstance(kwargs.get('schedule_type'), str):
+            kwargs['schedule_type'] = ScheduleType(kwargs['schedule_type'])
+        if isinstance(kwargs.get('status'), str):
+            kwargs['status'] = ScheduleStatus(kwargs['status'])
+        if now_iso is not None:
+            kwargs.setdefault('created_at', now_iso)
+            kwargs.setdefault('updated_at', now_iso)
+        return cls(**kwargs)
+
+
+# Campos aceptados por ScheduleConfig.__init__
+_FIELDS = frozenset(f.name for f in fields(ScheduleConfig) if f.init)
+
+
+def _trigger_key(schedule: ScheduleConfig) -> tuple:
+    """Campos que determinan el trigger de un schedule (hashable)"""
+    return (
+        schedule.schedule_type,
+        schedule.cron_expression,
+        schedule.interval_minutes,
+        schedule._hm,
+        schedule._dow_str,
+        schedule._dom_str,
+        schedule.run_date,
+    )
+
+
+@lru_cache(maxsize=256)
+def _trigger_for(schedule_type: ScheduleType, cron_expression: Optional[str],
+                 interval_minutes: Optional[int], hm: Optional[Tuple[int, int]],
+                 days_of_week: str, days_of_month: str, run_date: Optional[str]):
+    """Crea (y cachea) el trigger de APScheduler para una configuración"""
+    if schedule_type == ScheduleType.CRON:
+        return CronTrigger.from_crontab(cron_expression)
+    
+    elif schedule_type == ScheduleType.INTERVAL:
+        return IntervalTrigger(minutes=interval_minutes)
+    
+    elif schedule_type == ScheduleType.DAILY:
+        hour, minute = hm
+        return CronTrigger(hour=hour, minute=minute)
+    
+    elif schedule_type == ScheduleType.WEEKLY:
+        hour, minute = hm
+        return CronTrigger(day_of_week=days_of_week, hour=hour, minute=minute)
+    
+    elif schedule_type == ScheduleType.MONTHLY:
+        hour, minute = hm
+        return CronTrigger(day=days_of_month, hour=hour, minute=minute)
+    
+    elif schedule_type == ScheduleType.ONCE:
+        return DateTrigger(run_date=datetime.fromisoformat(run_date))
+    
+    raise ValueError(f"Tipo de schedule no soportado: {schedule_type}")
+
+
+@lru_cache(maxsize=256)
+def _next_run_for(key: tuple, minute: str) -> Optional[str]:
+    """Próxima ejecución para una configuración; `minute` acota la validez de la caché"""
+    next_time = _trigger_for(*key).get_next_fire_time(None, datetime.now())
+    return next_time.isoformat() if next_time else None
 
 
 class ScheduleHistory:
@@ -93,10 +212,13 @@ class ScheduleHistory:
     
     def __init__(self, max_entries: int = 100):
         self.max_entries = max_entries
-        self.entries: List[Dict[str, Any]] = []
+        self.entries: deque = deque(maxlen=max_entries)
+        # Índice por schedule para consultas O(limit)
+        self._by_id: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.max_entries))
     
     def add(self, schedule_id: str, schedule_name: str, backup_types: List[str], 
-            status: str, duration_seconds: float, message: str = ""):
+            status: str, duration_seconds: float, message: str = "",
+            timestamp: Optional[str] = None):
         """Añade entrada al historial"""
         entry = {
             "id": str(uuid4())[:8],
@@ -106,20 +228,26 @@ class ScheduleHistory:
             "status": status,
             "duration_seconds": duration_seconds,
             "message": message,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": timestamp or datetime.now().isoformat()
         }
-        self.entries.insert(0, entry)
-        # Mantener máximo de entradas
-        if len(self.entries) > self.max_entries:
-            self.entries = self.entries[:self.max_entries]
+        # Más reciente primero; el deque descarta las más antiguas
+        self.entries.appendleft(entry)
+        self._by_id[schedule_id].appendleft(entry)
     
     def get_recent(self, limit: int = 20) -> List[Dict[str, Any]]:
         """Obtiene entradas recientes"""
-        return self.entries[:limit]
+        return list(itertools.islice(self.entries, limit))
     
     def get_by_schedule(self, schedule_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Obtiene historial de un schedule específico"""
-        return [e for e in self.entries if e["schedule_id"] == schedule_id][:limit]
+        entries = self._by_id.get(schedule_id)
+        if not entries:
+            return []
+        return list(itertools.islice(entries, limit))
+    
+    def forget(self, schedule_id: str):
+        """Libera el índice de un schedule eliminado"""
+        self._by_id.pop(schedule_id, None)
 
 
 class BackupScheduler:
@@ -139,7 +267,25 @@ class BackupScheduler:
             }
         )
         self.history = ScheduleHistory()
-        self._running_backup = False
+        # Los disparos se encolan y un único consumidor los ejecuta en orden
+        self._backup_queue: asyncio.Queue = asyncio.Queue(maxsize=BACKUP_QUEUE_SIZE)
+        self._queued: set = set()
+        self._running: Optional[str] = None
+        self._consumer_task: Optional[asyncio.Task] = None
+        self._dirty = False
+        self._save_task: Optional[asyncio.Task] = None
+        # Expresiones cron ya parseadas por schedule
+        self._croniters: Dict[str, Any] = {}
+        # Índices para get_stats: contadores por estado y heap de próximas ejecuciones
+        # (las entradas obsoletas del heap se descartan al leerlo)
+        self._status_counts: Counter = Counter()
+        self._tracked: Dict[str, Tuple[ScheduleStatus, Optional[str]]] = {}
+        self._upcoming_heap: List[Tuple[str, str]] = []
+        # Versión del estado (sube en cada mutación); base de los ETag de la API
+        self._version = 0
+        self._epoch = uuid4().hex[:8]
+        # Respuestas serializadas por schedule (y builder); se invalidan en cada mutación
+        self._response_cache: Dict[str, Dict[Callable, Any]] = {}
         
         # Crear directorio si no existe
         self.config_file.parent.mkdir(parents=True, exist_ok=True)
@@ -151,74 +297,184 @@ class BackupScheduler:
         """Carga schedules desde archivo"""
         if self.config_file.exists():
             try:
-                with open(self.config_file) as f:
-                    data = json.load(f)
+                data = orjson.loads(self.config_file.read_bytes())
+                now_iso = datetime.now().isoformat()
                 for schedule_data in data.get('schedules', []):
-                    schedule = ScheduleConfig.from_dict(schedule_data)
+                    schedule = ScheduleConfig.from_dict(schedule_data, now_iso)
                     self.schedules[schedule.id] = schedule
+                    self._track(schedule.id)
                 logger.info(f"Cargados {len(self.schedules)} schedules")
             except Exception as e:
                 logger.error(f"Error cargando schedules: {e}")
     
     def _save_schedules(self):
-        """Guarda schedules a archivo"""
+        """Guarda schedules a archivo (escritura atómica)"""
+        self._dirty = False
         try:
-            data = {
+            payload = orjson.dumps({
                 'schedules': [s.to_dict() for s in self.schedules.values()],
                 'updated_at': datetime.now().isoformat()
-            }
-            with open(self.config_file, 'w') as f:
-                json.dump(data, f, indent=2, default=str)
+            }, option=orjson.OPT_APPEND_NEWLINE)
+            tmp_file = self.config_file.with_suffix('.tmp')
+            tmp_file.write_bytes(payload)
+            os.replace(tmp_file, self.config_file)
             logger.info("Schedules guardados")
         except Exception as e:
             logger.error(f"Error guardando schedules: {e}")
     
+    @property
+    def etag(self) -> str:
+        """ETag débil de la versión actual (el epoch evita colisiones tras reiniciar)"""
+        return f'W/"{self._epoch}-{self._version}"'
+    
+    def _track(self, schedule_id: str):
+        """Actualiza los índices de estadísticas tras cambiar (o borrar) un schedule"""
+        old = self._tracked.pop(schedule_id, None)
+        if old is not None:
+            self._status_counts[old[0]] -= 1
+        schedule = self.schedules.get(schedule_id)
+        if schedule is None:
+            return
+        entry = (schedule.status, schedule.next_run)
+        self._tracked[schedule_id] = entry
+        self._status_counts[schedule.status] += 1
+        if entry != old and schedule.status == ScheduleStatus.ACTIVE and schedule.next_run:
+            heapq.heappush(self._upcoming_heap, (schedule.next_run, schedule_id))
+            # Compactar si se acumulan demasiadas entradas obsoletas
+            if len(self._upcoming_heap) > 4 * len(self.schedules) + 32:
+                self._upcoming_heap = [
+                    (next_run, sid) for sid, (status, next_run) in self._tracked.items()
+                    if status == ScheduleStatus.ACTIVE and next_run
+                ]
+                heapq.heapify(self._upcoming_heap)
+    
+    def _touch(self, schedule_id: str):
+        """Invalida cachés e índices de un schedule modificado y programa el guardado"""
+        self._response_cache.pop(schedule_id, None)
+        self._track(schedule_id)
+        self._mark_dirty()
+    
+    def _mark_dirty(self):
+        """Programa un guardado diferido; varias mutaciones seguidas se escriben una sola vez"""
+        self._version += 1
+        self._dirty = True
+        if self._save_task and not self._save_task.done():
+            return
+        try:
+            self._save_task = asyncio.get_running_loop().create_task(
+                self._flush_after(SAVE_DEBOUNCE_SECONDS)
+            )
+        except RuntimeError:
+            # Sin event loop (p.ej. uso síncrono): guardar inmediatamente
+            self._save_schedules()
+    
+    async def _flush_after(self, delay: float):
+        """Guarda tras `delay` segundos si sigue habiendo cambios pendientes"""
+        await asyncio.sleep(delay)
+        if self._dirty:
+            self._save_schedules()
+    
+    def _flush_now(self):
+        """Cancela el guardado diferido y escribe los cambios pendientes"""
+        if self._save_task and not self._save_task.done():
+            self._save_task.cancel()
+        self._save_task = None
+        if self._dirty:
+            self._save_schedules()
+    
     def _get_trigger(self, schedule: ScheduleConfig):
         """Crea trigger de APScheduler según configuración"""
-        if schedule.schedule_type == ScheduleType.CRON:
-            return CronTrigger.from_crontab(schedule.cron_expression)
-        
-        elif schedule.schedule_type == ScheduleType.INTERVAL:
+        if schedule.schedule_type == ScheduleType.INTERVAL:
+            # IntervalTrigger fija su inicio al crearse: no se cachea
             return IntervalTrigger(minutes=schedule.interval_minutes)
-        
-        elif schedule.schedule_type == ScheduleType.DAILY:
-            hour, minute = map(int, schedule.time_of_day.split(':'))
-            return CronTrigger(hour=hour, minute=minute)
-        
-        elif schedule.schedule_type == ScheduleType.WEEKLY:
-            hour, minute = map(int, schedule.time_of_day.split(':'))
-            days = ','.join(str(d) for d in schedule.days_of_week)
-            return CronTrigger(day_of_week=days, hour=hour, minute=minute)
-        
-        elif schedule.schedule_type == ScheduleType.MONTHLY:
-            hour, minute = map(int, schedule.time_of_day.split(':'))
-            days = ','.join(str(d) for d in schedule.days_of_month)
-            return CronTrigger(day=days, hour=hour, minute=minute)
-        
-        elif schedule.schedule_type == ScheduleType.ONCE:
-            run_date = datetime.fromisoformat(schedule.run_date)
-            return DateTrigger(run_date=run_date)
-        
-        raise ValueError(f"Tipo de schedule no soportado: {schedule.schedule_type}")
+        return _trigger_for(*_trigger_key(schedule))
+    
+    def _cache_croniter(self, schedule: ScheduleConfig):
+        """Valida y guarda el croniter de un schedule CRON (ValueError si es inválido)"""
+        if schedule.schedule_type != ScheduleType.CRON:
+            self._croniters.pop(schedule.id, None)
+            return
+        try:
+            self._croniters[schedule.id] = croniter(schedule.cron_expression, datetime.now())
+        except (ValueError, TypeError) as e:
+            self._croniters.pop(schedule.id, None)
+            raise ValueError(f"Expresión cron inválida: {schedule.cron_expression}") from e
     
     def _calculate_next_run(self, schedule: ScheduleConfig) -> Optional[str]:
         """Calcula próxima ejecución"""
         try:
-            if schedule.schedule_type == ScheduleType.CRON:
-                cron = croniter(schedule.cron_expression, datetime.now())
-                return cron.get_next(datetime).isoformat()
-            elif schedule.schedule_type == ScheduleType.ONCE:
+            if schedule.schedule_type == ScheduleType.ONCE:
                 return schedule.run_date
-            else:
+            elif schedule.schedule_type == ScheduleType.CRON:
+                cron = self._croniters.get(schedule.id)
+                if cron is None:
+                    self._cache_croniter(schedule)
+                    cron = self._croniters[schedule.id]
+                cron.set_current(datetime.now(), True)
+                return cron.get_next(datetime).isoformat()
+            elif schedule.schedule_type == ScheduleType.INTERVAL:
                 trigger = self._get_trigger(schedule)
                 next_time = trigger.get_next_fire_time(None, datetime.now())
                 return next_time.isoformat() if next_time else None
+            # Resultado válido durante el minuto en curso
+            minute = datetime.now().strftime('%Y-%m-%dT%H:%M')
+            return _next_run_for(_trigger_key(schedule), minute)
         except Exception as e:
             logger.error(f"Error calculando next_run: {e}")
             return None
     
     async def _execute_scheduled_backup(self, schedule_id: str):
-        """Ejecuta backup programado"""
+        """Disparo de APScheduler: encola el backup programado"""
+        self._enqueue_backup(schedule_id)
+    
+    def _enqueue_backup(self, schedule_id: str) -> EnqueueResult:
+        """Encola un backup"""
+        schedule = self.schedules.get(schedule_id)
+        if schedule is None:
+            logger.error(f"Schedule {schedule_id} no encontrado")
+            return EnqueueResult.NOT_FOUND
+        
+        if schedule_id in self._queued:
+            logger.info(f"{schedule.name} ya está en cola, se omite el disparo duplicado")
+            return EnqueueResult.QUEUED
+        
+        try:
+            self._backup_queue.put_nowait(schedule_id)
+        except asyncio.QueueFull:
+            logger.warning(f"Cola de backups llena, se descarta la ejecución de {schedule.name}")
+            self.history.add(
+                schedule_id=schedule_id,
+                schedule_name=schedule.name,
+                backup_types=schedule.backup_types,
+                status="skipped",
+                duration_seconds=0,
+                message=f"Cola de backups llena ({BACKUP_QUEUE_SIZE} pendientes), ejecución descartada"
+            )
+            self._version += 1
+            return EnqueueResult.FULL
+        
+        self._queued.add(schedule_id)
+        if self._running is None and self._backup_queue.qsize() == 1:
+            return EnqueueResult.STARTED
+        logger.info(f"Backup encolado: {schedule.name}")
+        return EnqueueResult.QUEUED
+    
+    async def _consume_backups(self):
+        """Ejecuta secuencialmente los backups encolados"""
+        while True:
+            schedule_id = await self._backup_queue.get()
+            self._queued.discard(schedule_id)
+            self._running = schedule_id
+            try:
+                await self._run_backup(schedule_id)
+            except Exception as e:
+                logger.error(f"Error inesperado ejecutando {schedule_id}: {e}")
+            finally:
+                self._running = None
+                self._backup_queue.task_done()
+    
+    async def _run_backup(self, schedule_id: str):
+        """Ejecuta un backup programado"""
         if schedule_id not in self.schedules:
             logger.error(f"Schedule {schedule_id} no encontrado")
             return
@@ -229,12 +485,6 @@ class BackupScheduler:
             logger.info(f"Schedule {schedule.name} no está activo, saltando")
             return
         
-        if self._running_backup:
-            logger.warning(f"Ya hay un backup en ejecución, encolando {schedule.name}")
-            # Podríamos encolar, por ahora solo logueamos
-            return
-        
-        self._running_backup = True
         start_time = datetime.now()
         
         logger.info(f"🕐 Ejecutando backup programado: {schedule.name}")
@@ -244,46 +494,65 @@ class BackupScheduler:
             if schedule.sequential_execution:
                 for backup_type in schedule.backup_types:
                     if self.backup_callback:
-                        await self.backup_callback(backup_type, schedule_id)
+                        try:
+                            await self.backup_callback(backup_type, schedule_id)
+                        except Exception as e:
+                            raise RuntimeError(f"{backup_type}: {e}") from e
             else:
-                # En paralelo (si se soporta en el futuro)
+                # En paralelo: todos los tipos a la vez, recogiendo el resultado de cada uno
                 if self.backup_callback:
-                    await self.backup_callback(schedule.backup_types[0], schedule_id)
+                    results = await asyncio.gather(
+                        *(self.backup_callback(bt, schedule_id) for bt in schedule.backup_types),
+                        return_exceptions=True
+                    )
+                    failed = [
+                        f"{bt}: {result}"
+                        for bt, result in zip(schedule.backup_types, results)
+                        if isinstance(result, Exception)
+                    ]
+                    if failed:
+                        raise RuntimeError(
+                            f"Fallaron {len(failed)}/{len(results)} tipos de backup: " + "; ".join(failed)
+                        )
             
             # Actualizar estadísticas
-            schedule.last_run = datetime.now().isoformat()
+            end_time = datetime.now()
+            end_iso = end_time.isoformat()
+            schedule.last_run = end_iso
             schedule.run_count += 1
             schedule.last_status = "success"
             schedule.next_run = self._calculate_next_run(schedule)
             
-            duration = (datetime.now() - start_time).total_seconds()
+            duration = (end_time - start_time).total_seconds()
             self.history.add(
                 schedule_id=schedule_id,
                 schedule_name=schedule.name,
                 backup_types=schedule.backup_types,
                 status="success",
                 duration_seconds=duration,
-                message="Backup completado correctamente"
+                message="Backup completado correctamente",
+                timestamp=end_iso
             )
             
             logger.info(f"✅ Backup programado completado: {schedule.name}")
             
         except Exception as e:
             schedule.last_status = "failed"
-            duration = (datetime.now() - start_time).total_seconds()
+            end_time = datetime.now()
+            duration = (end_time - start_time).total_seconds()
             self.history.add(
                 schedule_id=schedule_id,
                 schedule_name=schedule.name,
                 backup_types=schedule.backup_types,
                 status="failed",
                 duration_seconds=duration,
-                message=str(e)
+                message=str(e),
+                timestamp=end_time.isoformat()
             )
             logger.error(f"❌ Error en backup programado {schedule.name}: {e}")
         
         finally:
-            self._running_backup = False
-            self._save_schedules()
+            self._touch(schedule_id)
     
     def start(self):
         """Inicia el scheduler"""
@@ -293,12 +562,19 @@ class BackupScheduler:
             for schedule in self.schedules.values():
                 if schedule.status == ScheduleStatus.ACTIVE:
                     self._register_schedule(schedule)
+            self._consumer_task = asyncio.get_running_loop().create_task(self._consume_backups())
+            self._version += 1
             logger.info("Scheduler iniciado")
     
     def stop(self):
         """Detiene el scheduler"""
+        self._flush_now()
+        if self._consumer_task:
+            self._consumer_task.cancel()
+            self._consumer_task = None
         if self.scheduler.running:
             self.scheduler.shutdown()
+            self._version += 1
             logger.info("Scheduler detenido")
     
     def _register_schedule(self, schedule: ScheduleConfig):
@@ -318,10 +594,14 @@ class BackupScheduler:
                 replace_existing=True
             )
             
-            # Actualizar next_run
+            # Actualizar next_run (y el índice de próximas ejecuciones)
             job = self.scheduler.get_job(schedule.id)
             if job and job.next_run_time:
-                schedule.next_run = job.next_run_time.isoformat()
+                next_run = job.next_run_time.isoformat()
+                if next_run != schedule.next_run:
+                    schedule.next_run = next_run
+                    self._response_cache.pop(schedule.id, None)
+                    self._track(schedule.id)
             
             logger.info(f"Schedule registrado: {schedule.name} ({schedule.schedule_type})")
         except Exception as e:
@@ -344,18 +624,42 @@ class BackupScheduler:
         """Crea un nuevo schedule"""
         schedule_id = str(uuid4())[:12]
         config['id'] = schedule_id
-        config['created_at'] = datetime.now().isoformat()
-        config['updated_at'] = datetime.now().isoformat()
+        now_iso = datetime.now().isoformat()
+        config['created_at'] = now_iso
+        config['updated_at'] = now_iso
         
         schedule = ScheduleConfig.from_dict(config)
+        self._cache_croniter(schedule)
+        return self._add_schedule(schedule)
+    
+    def create_from_preset(self, preset_id: str) -> Optional[ScheduleConfig]:
+        """Crea un schedule clonando la plantilla precomputada de un preset"""
+        template = _PRESET_TEMPLATES.get(preset_id)
+        if template is None:
+            return None
+        
+        now_iso = datetime.now().isoformat()
+        schedule = replace(
+            template,
+            id=str(uuid4())[:12],
+            backup_types=list(template.backup_types),
+            days_of_week=list(template.days_of_week) if template.days_of_week is not None else None,
+            days_of_month=list(template.days_of_month) if template.days_of_month is not None else None,
+            created_at=now_iso,
+            updated_at=now_iso,
+        )
+        return self._add_schedule(schedule)
+    
+    def _add_schedule(self, schedule: ScheduleConfig) -> ScheduleConfig:
+        """Calcula la próxima ejecución, registra y persiste un schedule nuevo"""
         schedule.next_run = self._calculate_next_run(schedule)
         
-        self.schedules[schedule_id] = schedule
+        self.schedules[schedule.id] = schedule
         
         if schedule.status == ScheduleStatus.ACTIVE and self.scheduler.running:
             self._register_schedule(schedule)
         
-        self._save_schedules()
+        self._touch(schedule.id)
         return schedule
     
     def update_schedule(self, schedule_id: str, updates: Dict[str, Any]) -> Optional[ScheduleConfig]:
@@ -365,6 +669,17 @@ class BackupScheduler:
         
         schedule = self.schedules[schedule_id]
         
+        # Validar la expresión cron resultante antes de modificar nada
+        if updates.keys() & {'schedule_type', 'cron_expression'}:
+            new_type = ScheduleType(updates.get('schedule_type', schedule.schedule_type))
+            if new_type == ScheduleType.CRON:
+                try:
+                    croniter(updates.get('cron_expression', schedule.cron_expression), datetime.now())
+                except (ValueError, TypeError) as e:
+                    raise ValueError(
+                        f"Expresión cron inválida: {updates.get('cron_expression', schedule.cron_expression)}"
+                    ) from e
+        
         # Actualizar campos
         for key, value in updates.items():
             if hasattr(schedule, key) and key not in ['id', 'created_at']:
@@ -374,8 +689,15 @@ class BackupScheduler:
                     value = ScheduleStatus(value)
                 setattr(schedule, key, value)
         
+        if updates.keys() & {'time_of_day', 'days_of_week', 'days_of_month'}:
+            schedule.refresh_derived()
+        if updates.keys() & {'schedule_type', 'cron_expression'}:
+            self._cache_croniter(schedule)
+        
         schedule.updated_at = datetime.now().isoformat()
-        schedule.next_run = self._calculate_next_run(schedule)
+        # Un cambio solo de estado (pausar/reanudar) no altera la programación
+        if updates.keys() - {'status'}:
+            schedule.next_run = self._calculate_next_run(schedule)
         
         # Re-registrar si está activo
         if schedule.status == ScheduleStatus.ACTIVE and self.scheduler.running:
@@ -383,7 +705,7 @@ class BackupScheduler:
         else:
             self._unregister_schedule(schedule_id)
         
-        self._save_schedules()
+        self._touch(schedule_id)
         return schedule
     
     def delete_schedule(self, schedule_id: str) -> bool:
@@ -393,7 +715,9 @@ class BackupScheduler:
         
         self._unregister_schedule(schedule_id)
         del self.schedules[schedule_id]
-        self._save_schedules()
+        self.history.forget(schedule_id)
+        self._croniters.pop(schedule_id, None)
+        self._touch(schedule_id)
         return True
     
     def get_schedule(self, schedule_id: str) -> Optional[ScheduleConfig]:
@@ -404,6 +728,21 @@ class BackupScheduler:
         """Obtiene todos los schedules"""
         return list(self.schedules.values())
     
+    def get_response(self, schedule_id: str, builder: Callable[[ScheduleConfig], Any]) -> Optional[Any]:
+        """Obtiene la respuesta de un schedule, construyéndola solo si cambió"""
+        schedule = self.schedules.get(schedule_id)
+        if schedule is None:
+            return None
+        cached = self._response_cache.setdefault(schedule_id, {})
+        response = cached.get(builder)
+        if response is None:
+            response = cached[builder] = builder(schedule)
+        return response
+    
+    def get_all_responses(self, builder: Callable[[ScheduleConfig], Any]) -> List[Any]:
+        """Obtiene las respuestas de todos los schedules (cacheadas)"""
+        return [self.get_response(sid, builder) for sid in self.schedules]
+    
     def pause_schedule(self, schedule_id: str) -> Optional[ScheduleConfig]:
         """Pausa un schedule"""
         return self.update_schedule(schedule_id, {'status': ScheduleStatus.PAUSED})
@@ -412,12 +751,9 @@ class BackupScheduler:
         """Reanuda un schedule pausado"""
         return self.update_schedule(schedule_id, {'status': ScheduleStatus.ACTIVE})
     
-    def run_now(self, schedule_id: str):
-        """Ejecuta un schedule inmediatamente"""
-        if schedule_id in self.schedules:
-            asyncio.create_task(self._execute_scheduled_backup(schedule_id))
-            return True
-        return False
+    def run_now(self, schedule_id: str) -> EnqueueResult:
+        """Ejecuta un schedule inmediatamente (o lo encola si hay otro en curso)"""
+        return self._enqueue_backup(schedule_id)
     
     def get_history(self, schedule_id: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
         """Obtiene historial de ejecuciones"""
@@ -428,20 +764,31 @@ class BackupScheduler:
     def get_stats(self) -> Dict[str, Any]:
         """Obtiene estadísticas del scheduler"""
         total = len(self.schedules)
-        active = sum(1 for s in self.schedules.values() if s.status == ScheduleStatus.ACTIVE)
-        paused = sum(1 for s in self.schedules.values() if s.status == ScheduleStatus.PAUSED)
+        active = self._status_counts[ScheduleStatus.ACTIVE]
+        paused = self._status_counts[ScheduleStatus.PAUSED]
+        
+        # Próximas ejecuciones: extraer del heap las 5 primeras vigentes y devolverlas
+        heap = self._upcoming_heap
+        valid: List[Tuple[str, str]] = []
+        seen = set()
+        while heap and len(valid) < 5:
+            next_run, sid = heapq.heappop(heap)
+            if sid in seen or self._tracked.get(sid) != (ScheduleStatus.ACTIVE, next_run):
+                continue
+            seen.add(sid)
+            valid.append((next_run, sid))
+        for item in valid:
+            heapq.heappush(heap, item)
         
-        # Próximas ejecuciones
         upcoming = []
-        for schedule in self.schedules.values():
-            if schedule.status == ScheduleStatus.ACTIVE and schedule.next_run:
-                upcoming.append({
-                    'id': schedule.id,
-                    'name': schedule.name,
-                    'next_run': schedule.next_run,
-                    'backup_types': schedule.backup_types
-                })
-        upcoming.sort(key=lambda x: x['next_run'])
+        for next_run, sid in valid:
+            schedule = self.schedules[sid]
+            upcoming.append({
+                'id': sid,
+                'name': schedule.name,
+                'next_run': next_run,
+                'backup_types': schedule.backup_types
+            })
         
         return {
             'total_schedules': total,
@@ -449,7 +796,7 @@ class BackupScheduler:
             'paused': paused,
             'disabled': total - active - paused,
             'scheduler_running': self.scheduler.running,
-            'upcoming_runs': upcoming[:5],
+            'upcoming_runs': upcoming,
             'recent_history': self.history.get_recent(5)
         }
 
@@ -495,3 +842,10 @@ SCHEDULE_PRESETS = {
         'backup_types': ['mongodb']
     }
 }
+
+
+# Plantillas de presets ya convertidas a ScheduleConfig (se clonan al crear)
+_PRESET_TEMPLATES = {
+    key: ScheduleConfig.from_dict({**preset, 'id': ''})
+    for key, preset in SCHEDULE_PRESETS.items()
+}
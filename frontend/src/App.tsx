@@ -30,7 +30,7 @@ import {
   BackupTask, 
   BackupType, 
   DiskUsage,
-  Schedule,
+  ScheduleListItem,
   SchedulePreset,
   SchedulerStats,
   ScheduleHistory,
@@ -118,7 +118,7 @@ export default function App() {
   const [taskOutput, setTaskOutput] = useState<string[]>([]);
   
   // Schedule state
-  const [schedules, setSchedules] = useState<Schedule[]>([]);
+  const [schedules, setSchedules] = useState<ScheduleListItem[]>([]);
   const [schedulerStats, setSchedulerStats] = useState<SchedulerStats | null>(null);
   const [presets, setPresets] = useState<SchedulePreset[]>([]);
   const [scheduleHistory, setScheduleHistory] = useState<ScheduleHistory[]>([]);
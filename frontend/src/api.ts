@@ -81,6 +81,25 @@ export interface Schedule {
   max_retries: number;
 }
 
+// Resumen devuelto por GET /schedules (el detalle completo está en GET /schedules/{id})
+export type ScheduleListItem = Pick<
+  Schedule,
+  | 'id'
+  | 'name'
+  | 'description'
+  | 'status'
+  | 'schedule_type'
+  | 'backup_types'
+  | 'cron_expression'
+  | 'interval_minutes'
+  | 'time_of_day'
+  | 'days_of_week'
+  | 'next_run'
+  | 'last_run'
+  | 'last_status'
+  | 'run_count'
+>;
+
 export interface ScheduleCreateRequest {
   name: string;
   description?: string;
@@ -131,7 +150,7 @@ export interface ScheduleHistory {
   schedule_id: string;
   schedule_name: string;
   backup_types: BackupType[];
-  status: 'success' | 'failed';
+  status: 'success' | 'failed' | 'skipped';
   duration_seconds: number;
   message: string;
   timestamp: string;
@@ -172,6 +191,17 @@ async function fetchApi<T>(endpoint: string, options?: RequestInit): Promise<T>
   return response.json();
 }
 
+async function fetchText(endpoint: string): Promise<string> {
+  const response = await fetch(`${API_BASE}${endpoint}`);
+
+  if (!response.ok) {
+    const error = await response.json().catch(() => ({ detail: 'Error desconocido' }));
+    throw new Error(error.detail || `HTTP ${response.status}`);
+  }
+
+  return response.text();
+}
+
 export const api = {
   // Status
   getStatus: () => fetchApi<SystemStatus>('/status'),
@@ -202,10 +232,10 @@ export const api = {
   getDiskUsage: () => fetchApi<DiskUsage>('/disk-usage'),
   
   // Logs
-  getLogs: (timestamp: string) => fetchApi<Record<string, string>>(`/logs/${timestamp}`),
+  getLogs: (timestamp: string) => fetchText(`/logs/${timestamp}`),
   
   // Schedules
-  getSchedules: () => fetchApi<Schedule[]>('/schedules'),
+  getSchedules: () => fetchApi<ScheduleListItem[]>('/schedules'),
   getSchedule: (id: string) => fetchApi<Schedule>(`/schedules/${id}`),
   getSchedulerStats: () => fetchApi<SchedulerStats>('/schedules/stats'),
   getSchedulePresets: () => fetchApi<{ presets: SchedulePreset[] }>('/schedules/presets'),
@@ -242,5 +272,5 @@ export const api = {
     fetchApi<{ status: string; schedule_id: string }>(`/schedules/${id}/resume`, { method: 'POST' }),
   
   runScheduleNow: (id: string) =>
-    fetchApi<{ status: string; schedule_id: string; message: string }>(`/schedules/${id}/run-now`, { method: 'POST' }),
+    fetchApi<{ status: 'started' | 'queued'; schedule_id: string; message: string }>(`/schedules/${id}/run-now`, { method: 'POST' }),
 };
@@ -6,20 +6,25 @@ Exporta colecciones a formato JSON/Parquet para backup granular
 
 import os
 import sys
-import json
 import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Optional
 
 try:
-    from pymilvus import connections, utility, Collection
-    import numpy as np
-except ImportError:
-    print("❌ Instalando dependencias...")
-    os.system("pip install pymilvus numpy")
-    from pymilvus import connections, utility, Collection
-    import numpy as np
+    import grpc
+    from pymilvus import MilvusClient
+    from pymilvus.exceptions import MilvusException
+    import orjson
+    import zstandard as zstd
+    from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+except ImportError as e:
+    raise SystemExit(f"❌ Faltan dependencias ({e.name}): "
+                     f"pip install -r {Path(__file__).resolve().parent / 'requirements.txt'}")
 
 # Configuración
 MILVUS_INSTANCES = [
@@ -33,6 +38,19 @@ MILVUS_INSTANCES = [
 
 QNAP_BACKUP_PATH = "/Volumes/QNAPBackup/milvus-backups/collections"
 
+# Nivel zstd de los ficheros de metadatos (el JSON comprime ~5x)
+ZSTD_LEVEL = 3
+
+# Reintentos ante errores transitorios de Milvus/gRPC (espera exponencial)
+RPC_RETRIES = 3
+
+# Resúmenes mayores que esto (bytes) guardan las cadenas repetidas en una tabla
+SUMMARY_STRTAB_THRESHOLD = 1 << 20
+STRTAB_MIN_REPEATS = 3
+
+# RPC de colecciones en vuelo a la vez (compartido entre todas las instancias)
+COLLECTION_WORKERS = int(os.environ.get("MILVUS_COLLECTION_WORKERS", "16"))
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -40,18 +58,136 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Solo se reintentan errores de Milvus/gRPC; el resto se propaga de inmediato
+RETRYABLE_ERRORS = (MilvusException, grpc.RpcError)
+
+_rpc_retry = retry(
+    stop=stop_after_attempt(RPC_RETRIES),
+    wait=wait_exponential(multiplier=0.5, max=5),
+    retry=retry_if_exception_type(RETRYABLE_ERRORS),
+    reraise=True,
+)
+
+
+def encode_strtab(obj: Dict, min_repeats: int = STRTAB_MIN_REPEATS) -> Dict:
+    """Sustituye las cadenas repetidas por {"$ref": i} contra obj["_strtab"]"""
+    counts: Counter = Counter()
+    
+    def count(value):
+        if isinstance(value, str):
+            counts[value] += 1
+        elif isinstance(value, dict):
+            for v in value.values():
+                count(v)
+        elif isinstance(value, list):
+            for v in value:
+                count(v)
+    
+    count(obj)
+    # Solo compensa internar una cadena si sus referencias ocupan menos que sus
+    # repeticiones, contando también su entrada en la tabla
+    table: List[str] = []
+    for text, n in counts.most_common():
+        if n < min_repeats:
+            break
+        size = len(orjson.dumps(text))
+        ref_size = len(orjson.dumps({"$ref": len(table)}))
+        if n * (size - ref_size) > size + 1:
+            table.append(text)
+    index = {text: i for i, text in enumerate(table)}
+    
+    def encode(value):
+        if isinstance(value, str):
+            i = index.get(value)
+            return value if i is None else {"$ref": i}
+        if isinstance(value, dict):
+            return {k: encode(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [encode(v) for v in value]
+        return value
+    
+    return {**encode(obj), "_strtab": table}
+
+
+def decode_strtab(obj: Dict) -> Dict:
+    """Inversa de encode_strtab (para herramientas de restauración)"""
+    if "_strtab" not in obj:
+        return obj
+    table = obj["_strtab"]
+    
+    def decode(value):
+        if isinstance(value, dict):
+            if len(value) == 1 and "$ref" in value:
+                return table[value["$ref"]]
+            return {k: decode(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [decode(v) for v in value]
+        return value
+    
+    return decode({k: v for k, v in obj.items() if k != "_strtab"})
+
+
+@dataclass(slots=True)
+class FieldInfo:
+    """Campo de un schema tal como se guarda en el backup"""
+    name: str
+    dtype: str
+    is_primary: bool
+    auto_id: bool
+    dim: Optional[int] = None
+    max_length: Optional[int] = None
+
+
+class NdjsonWriter:
+    """Fichero NDJSON comprimido con zstd, compartido por los hilos de una instancia"""
+    
+    def __init__(self, path: Path):
+        self.path = path
+        # Un compresor por fichero: ZstdCompressor no admite uso concurrente
+        compressor = zstd.ZstdCompressor(level=ZSTD_LEVEL, threads=-1)
+        self._stream = compressor.stream_writer(open(path, "wb"))
+        self._lock = threading.Lock()
+    
+    def write(self, record: Dict):
+        line = orjson.dumps(record) + b"\n"
+        with self._lock:
+            self._stream.write(line)
+    
+    def close(self):
+        # Cierra el frame zstd y el fichero subyacente
+        self._stream.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
 
 class MilvusBackup:
     def __init__(self, backup_path: str):
         self.backup_path = Path(backup_path)
-        self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Un único instante para todo el backup (directorio, registros y resumen)
+        started = datetime.now()
+        self.timestamp = started.strftime("%Y%m%d_%H%M%S")
+        self.backup_date_iso = started.isoformat()
         self.backup_dir = self.backup_path / f"backup_{self.timestamp}"
+        # Crear de una vez todo el árbol (un directorio por instancia)
         self.backup_dir.mkdir(parents=True, exist_ok=True)
+        for instance in MILVUS_INSTANCES:
+            (self.backup_dir / instance["name"]).mkdir(exist_ok=True)
+        # Un MilvusClient por instancia (alias)
+        self.clients: Dict[str, MilvusClient] = {}
+        # Pool único para las colecciones de todas las instancias
+        self.executor = ThreadPoolExecutor(max_workers=COLLECTION_WORKERS)
         
     def connect(self, alias: str, host: str, port: int) -> bool:
-        """Conectar a una instancia de Milvus"""
+        """Conectar a una instancia de Milvus (reutiliza la conexión si ya existe)"""
+        if alias in self.clients:
+            return True
+        
         try:
-            connections.connect(alias=alias, host=host, port=port, timeout=10)
+            self.clients[alias] = self._open_client(host, port)
             logger.info(f"✅ Conectado a {alias} ({host}:{port})")
             return True
         except Exception as e:
@@ -60,102 +196,157 @@ class MilvusBackup:
     
     def disconnect(self, alias: str):
         """Desconectar de una instancia"""
+        client = self.clients.pop(alias, None)
         try:
-            connections.disconnect(alias=alias)
-        except:
-            pass
+            if client:
+                client.close()
+        except RETRYABLE_ERRORS as e:
+            logger.warning(f"⚠️ Error cerrando conexión con {alias}: {e}")
+    
+    def close(self):
+        """Cerrar el pool y todas las conexiones abiertas"""
+        self.executor.shutdown(wait=True)
+        for alias in list(self.clients):
+            self.disconnect(alias)
+    
+    # ============================================
+    # RPC con reintentos
+    # ============================================
+    
+    @staticmethod
+    @_rpc_retry
+    def _open_client(host: str, port: int) -> MilvusClient:
+        return MilvusClient(uri=f"http://{host}:{port}", timeout=10)
+    
+    @staticmethod
+    @_rpc_retry
+    def _list(client: MilvusClient) -> List[str]:
+        return client.list_collections()
+    
+    @staticmethod
+    @_rpc_retry
+    def _stats(client: MilvusClient, collection_name: str) -> int:
+        return client.get_collection_stats(collection_name).get("row_count", 0)
+    
+    @staticmethod
+    @_rpc_retry
+    def _describe(client: MilvusClient, collection_name: str) -> Dict:
+        return client.describe_collection(collection_name)
+    
+    @staticmethod
+    @_rpc_retry
+    def _list_indexes(client: MilvusClient, collection_name: str) -> List[Dict]:
+        return [client.describe_index(collection_name, index_name)
+                for index_name in client.list_indexes(collection_name)]
     
     def list_collections(self, alias: str) -> List[str]:
-        """Listar todas las colecciones"""
+        """Listar todas las colecciones (propaga el error: no es lo mismo que no tener ninguna)"""
         try:
-            return utility.list_collections(using=alias)
+            return self._list(self.clients[alias])
         except Exception as e:
             logger.error(f"Error listando colecciones: {e}")
-            return []
+            raise
     
-    def backup_collection_schema(self, collection_name: str, alias: str, instance_dir: Path) -> Dict:
+    def backup_collection_schema(self, collection_name: str, alias: str, writer: NdjsonWriter,
+                                 num_entities: int, include_indexes: bool = True) -> Dict:
         """Backup del schema de una colección"""
         try:
-            collection = Collection(collection_name, using=alias)
-            schema = collection.schema
+            client = self.clients[alias]
+            # describe_collection devuelve schema, tipos y parámetros en una sola RPC
+            desc = self._describe(client, collection_name)
             
+            fields: List[FieldInfo] = []
+            indexes: List[Dict] = []
             schema_info = {
                 "collection_name": collection_name,
-                "description": schema.description,
-                "fields": [],
-                "num_entities": collection.num_entities,
-                "indexes": []
+                "description": desc.get("description", ""),
+                "fields": fields,
+                "num_entities": num_entities,
+                "indexes": indexes
             }
             
-            for field in schema.fields:
-                field_info = {
-                    "name": field.name,
-                    "dtype": str(field.dtype),
-                    "is_primary": field.is_primary,
-                    "auto_id": field.auto_id if hasattr(field, 'auto_id') else False,
-                }
-                if hasattr(field, 'dim'):
-                    field_info["dim"] = field.dim
-                if hasattr(field, 'max_length'):
-                    field_info["max_length"] = field.max_length
-                schema_info["fields"].append(field_info)
+            fields_append = fields.append
+            for field in desc.get("fields", []):
+                params = field.get("params", {})
+                fields_append(FieldInfo(
+                    name=field["name"],
+                    dtype=str(field["type"]),
+                    is_primary=field.get("is_primary", False),
+                    auto_id=field.get("auto_id", False),
+                    dim=params.get("dim"),
+                    max_length=params.get("max_length"),
+                ))
             
             # Obtener índices
-            try:
-                for field in schema.fields:
-                    if hasattr(field, 'dtype') and 'FLOAT_VECTOR' in str(field.dtype):
-                        index_info = collection.index()
+            if include_indexes:
+                try:
+                    indexes_append = indexes.append
+                    for index_info in self._list_indexes(client, collection_name):
                         if index_info:
-                            schema_info["indexes"].append({
-                                "field": field.name,
-                                "params": str(index_info.params)
+                            indexes_append({
+                                "field": index_info.get("field_name"),
+                                "params": {k: v for k, v in index_info.items()
+                                           if k not in ("field_name", "index_name")}
                             })
-            except:
-                pass
+                except RETRYABLE_ERRORS as e:
+                    logger.warning(f"  ⚠️ No se pudieron leer los índices de {collection_name}: {e}")
             
             # Guardar schema
-            schema_file = instance_dir / f"{collection_name}_schema.json"
-            with open(schema_file, 'w') as f:
-                json.dump(schema_info, f, indent=2, default=str)
+            writer.write({"record": "schema", **schema_info})
             
-            logger.info(f"  📋 Schema guardado: {collection_name} ({collection.num_entities} entidades)")
+            logger.info(f"  📋 Schema guardado: {collection_name} ({num_entities} entidades)")
             return schema_info
             
         except Exception as e:
             logger.error(f"  ❌ Error en schema de {collection_name}: {e}")
-            return {}
+            raise
     
-    def backup_collection_data(self, collection_name: str, alias: str, instance_dir: Path, batch_size: int = 1000) -> bool:
+    def backup_collection_data(self, collection_name: str, writer: NdjsonWriter, num_entities: int):
         """Backup de los datos de una colección (solo metadatos, vectores son muy grandes)"""
         try:
-            collection = Collection(collection_name, using=alias)
-            collection.load()
-            
-            # Solo exportamos estadísticas y sample de datos para colecciones grandes
-            num_entities = collection.num_entities
-            
-            if num_entities == 0:
-                logger.info(f"  📭 Colección vacía: {collection_name}")
-                return True
-            
             data_info = {
                 "collection_name": collection_name,
                 "num_entities": num_entities,
-                "backup_date": datetime.now().isoformat(),
+                "backup_date": self.backup_date_iso,
                 "note": "Full data backup requires milvus-backup tool for large collections"
             }
             
             # Guardar info
-            data_file = instance_dir / f"{collection_name}_info.json"
-            with open(data_file, 'w') as f:
-                json.dump(data_info, f, indent=2)
+            writer.write({"record": "info", **data_info})
             
             logger.info(f"  💾 Info guardada: {collection_name}")
-            return True
             
         except Exception as e:
             logger.error(f"  ❌ Error exportando datos de {collection_name}: {e}")
-            return False
+            raise
+    
+    def backup_collection(self, collection_name: str, alias: str, writer: NdjsonWriter) -> Dict:
+        """Backup de una colección: stats primero y, si está vacía, solo su schema.
+        
+        Si algo falla la entrada lleva "error" (no se confunde con una colección vacía).
+        """
+        logger.info(f"  🔄 Procesando: {collection_name}")
+        entry = {"name": collection_name, "entities": 0}
+        try:
+            num_entities = self._stats(self.clients[alias], collection_name)
+        except Exception as e:
+            logger.error(f"  ❌ Error obteniendo stats de {collection_name}: {e}")
+            entry["error"] = str(e)
+            return entry
+        entry["entities"] = num_entities
+        
+        try:
+            if num_entities == 0:
+                # Se conserva el schema (lo único que hay que restaurar) sin enumerar índices
+                self.backup_collection_schema(collection_name, alias, writer, 0, include_indexes=False)
+                logger.info(f"  📭 Colección vacía: {collection_name}")
+                return entry
+            
+            self.backup_collection_schema(collection_name, alias, writer, num_entities)
+            self.backup_collection_data(collection_name, writer, num_entities)
+        except Exception as e:
+            entry["error"] = str(e)
+        return entry
     
     def backup_instance(self, instance: Dict) -> Dict:
         """Backup completo de una instancia de Milvus"""
@@ -163,6 +354,8 @@ class MilvusBackup:
         host = instance["host"]
         port = instance["port"]
         
+        logger.info(f"📌 Procesando: {alias}")
+        
         result = {
             "instance": alias,
             "host": f"{host}:{port}",
@@ -183,24 +376,26 @@ class MilvusBackup:
                 return result
             
             instance_dir = self.backup_dir / alias
-            instance_dir.mkdir(parents=True, exist_ok=True)
             
-            for coll_name in collections:
-                logger.info(f"  🔄 Procesando: {coll_name}")
-                schema = self.backup_collection_schema(coll_name, alias, instance_dir)
-                self.backup_collection_data(coll_name, alias, instance_dir)
-                result["collections"].append({
-                    "name": coll_name,
-                    "entities": schema.get("num_entities", 0)
-                })
+            # Las RPC de metadatos dominan: se lanzan en paralelo sobre el mismo alias
+            # Un único collections.ndjson.zst por instancia en lugar de dos JSON por colección
+            with NdjsonWriter(instance_dir / "collections.ndjson.zst") as writer:
+                result["collections"].extend(self.executor.map(
+                    lambda name: self.backup_collection(name, alias, writer),
+                    collections
+                ))
             
-            result["status"] = "success"
+            # Alguna colección sin respaldar: backup parcial (main() sale con código 1)
+            failed = sum(1 for c in result["collections"] if "error" in c)
+            if failed:
+                result["status"] = "partial"
+                result["error"] = f"{failed}/{len(collections)} colecciones con errores"
+            else:
+                result["status"] = "success"
             
         except Exception as e:
             logger.error(f"Error en backup de {alias}: {e}")
             result["error"] = str(e)
-        finally:
-            self.disconnect(alias)
         
         return result
     
@@ -212,23 +407,25 @@ class MilvusBackup:
         logger.info("=" * 60)
         
         results = {
-            "backup_date": datetime.now().isoformat(),
+            "backup_date": self.backup_date_iso,
             "backup_path": str(self.backup_dir),
             "instances": []
         }
         
-        for instance in MILVUS_INSTANCES:
-            logger.info(f"\n{'='*40}")
-            logger.info(f"📌 Procesando: {instance['name']}")
-            logger.info(f"{'='*40}")
-            
-            result = self.backup_instance(instance)
-            results["instances"].append(result)
+        # Las instancias son independientes (un alias de conexión cada una):
+        # se respaldan en paralelo; map conserva el orden de MILVUS_INSTANCES
+        with ThreadPoolExecutor(max_workers=len(MILVUS_INSTANCES)) as executor:
+            results["instances"].extend(executor.map(self.backup_instance, MILVUS_INSTANCES))
         
         # Guardar resumen
         summary_file = self.backup_dir / "backup_summary.json"
-        with open(summary_file, 'w') as f:
-            json.dump(results, f, indent=2)
+        payload = orjson.dumps(results, option=orjson.OPT_INDENT_2)
+        if len(payload) > SUMMARY_STRTAB_THRESHOLD:
+            # Forma compacta (sin indentar); solo se usa si realmente ocupa menos
+            encoded = orjson.dumps(encode_strtab(results))
+            if len(encoded) < len(payload):
+                payload = encoded
+        summary_file.write_bytes(payload)
         
         # Mostrar resumen
         logger.info("\n" + "=" * 60)
@@ -237,7 +434,7 @@ class MilvusBackup:
         
         total_collections = 0
         for inst in results["instances"]:
-            status_icon = "✅" if inst["status"] == "success" else "❌"
+            status_icon = {"success": "✅", "partial": "⚠️"}.get(inst["status"], "❌")
             num_colls = len(inst.get("collections", []))
             total_collections += num_colls
             logger.info(f"  {status_icon} {inst['instance']}: {num_colls} colecciones")
@@ -259,7 +456,10 @@ def main():
         backup_path = QNAP_BACKUP_PATH
     
     backup = MilvusBackup(backup_path)
-    results = backup.run_full_backup()
+    try:
+        results = backup.run_full_backup()
+    finally:
+        backup.close()
     
     return 0 if all(r["status"] == "success" for r in results["instances"]) else 1
 